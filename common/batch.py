@@ -0,0 +1,61 @@
+"""
+Shared: OpenAI Batch API Runner
+===============================
+Submits many chat completion requests as one Batch API job. Batches cost
+50% less and run in parallel on the server. Use this only for scripted,
+offline runs: a batch can take minutes (up to 24h) to finish.
+"""
+
+import json
+import asyncio
+from openai.types.chat import ChatCompletion
+
+POLL_INTERVAL = 10  # seconds
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+async def run_batch(client, requests: dict) -> dict:
+    """Run {custom_id: request body} as one batch job; return {custom_id: ChatCompletion}"""
+    lines = [
+        {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+        for custom_id, body in requests.items()
+    ]
+    batch_input = "\n".join(json.dumps(line) for line in lines).encode()
+    input_file = await client.files.create(file=("batch_input.jsonl", batch_input), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} ({len(lines)} requests)")
+    
+    # Poll until the batch reaches a terminal state
+    while batch.status not in TERMINAL_STATUSES:
+        await asyncio.sleep(POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"  Batch status: {batch.status}")
+    
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+    
+    # Successful requests land in the output file, failed ones in the error
+    # file - either can be missing when every request went the same way
+    results, failures = {}, {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                failures[item["custom_id"]] = item.get("error") or response.get("body")
+            else:
+                results[item["custom_id"]] = ChatCompletion.model_validate(response["body"])
+    
+    # Every submitted request must come back, or callers fail later on a bare KeyError
+    problems = [f"'{custom_id}' failed: {error}" for custom_id, error in failures.items()]
+    problems += [f"'{custom_id}' returned no result" for custom_id in requests if custom_id not in results and custom_id not in failures]
+    if problems:
+        raise RuntimeError(f"Batch {batch.id}: {len(problems)} of {len(requests)} requests failed - " + "; ".join(problems))
+    return results
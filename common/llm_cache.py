@@ -0,0 +1,87 @@
+"""
+Shared: Disk Cache for LLM Calls
+================================
+Demos are re-run in class with the exact same requests. This cache stores
+each chat completion under .llm_cache/<sha256 of the request>.json so a
+replay is read from disk instead of paying for another API call.
+
+Only deterministic requests (temperature unset or 0) are cached. Set
+LLM_CACHE=0 to bypass the cache and always call the API.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from openai.types.chat import ChatCompletion
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".llm_cache"
+
+# Hit/miss counters for the current process
+stats = {"hits": 0, "misses": 0}
+
+
+def _to_json(obj):
+    """Serialize SDK objects (e.g. assistant messages in history) for hashing"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def _cache_path(kwargs: dict) -> Path:
+    """Hash the canonicalized request into a cache file path"""
+    canonical = dict(kwargs)
+    if "tools" in canonical:
+        canonical["tools"] = sorted(canonical["tools"], key=lambda t: t["function"]["name"])
+    payload = json.dumps(canonical, sort_keys=True, default=_to_json)
+    key = hashlib.sha256(payload.encode()).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def _cacheable(kwargs: dict) -> bool:
+    """Sampled responses (temperature > 0) are not reproducible, so don't replay them"""
+    return os.getenv("LLM_CACHE") != "0" and not kwargs.get("temperature")
+
+
+def cache_get(kwargs: dict) -> dict | None:
+    """Return the stored JSON for a request, or None on a miss"""
+    if not _cacheable(kwargs):
+        return None
+    path = _cache_path(kwargs)
+    if not path.exists():
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    with open(path) as f:
+        return json.load(f)
+
+
+def cache_put(kwargs: dict, data: dict):
+    """Store JSON for a request"""
+    if not _cacheable(kwargs):
+        return
+    CACHE_DIR.mkdir(exist_ok=True)
+    with open(_cache_path(kwargs), "w") as f:
+        json.dump(data, f)
+
+
+def cached_completions_create(client, **kwargs) -> ChatCompletion:
+    """Drop-in for client.chat.completions.create() that replays from disk"""
+    cached = cache_get(kwargs)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    
+    response = client.chat.completions.create(**kwargs)
+    cache_put(kwargs, response.model_dump())
+    return response
+
+
+async def acached_completions_create(client, **kwargs) -> ChatCompletion:
+    """Async version of cached_completions_create() for AsyncOpenAI clients"""
+    cached = cache_get(kwargs)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    
+    response = await client.chat.completions.create(**kwargs)
+    cache_put(kwargs, response.model_dump())
+    return response
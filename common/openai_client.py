@@ -0,0 +1,48 @@
+"""
+Shared: Lazily Created OpenAI Clients
+=====================================
+get_client() / get_async_client() load .env and build the SDK client on
+first use, then return the same instance on every later call. Importing a
+demo no longer parses .env or constructs clients.
+
+Each client uses a pooled HTTP/2 connection. Concurrent requests (e.g. from
+asyncio.gather) are multiplexed over one TLS connection instead of each
+opening its own. await warmup() before the first real request so the
+TCP/TLS handshake isn't billed to it.
+"""
+
+import os
+import functools
+import httpx
+from openai import OpenAIError, OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+
+@functools.cache
+def get_client() -> OpenAI:
+    """Shared synchronous client"""
+    load_dotenv()
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=DefaultHttpxClient(http2=True, timeout=30, limits=_LIMITS)
+    )
+
+
+@functools.cache
+def get_async_client() -> AsyncOpenAI:
+    """Shared asynchronous client"""
+    load_dotenv()
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=DefaultAsyncHttpxClient(http2=True, timeout=30, limits=_LIMITS)
+    )
+
+
+async def warmup(model: str = "gpt-5-mini"):
+    """Open the async client's pooled connection with a cheap request"""
+    try:
+        await get_async_client().models.retrieve(model)
+    except OpenAIError:
+        pass  # Best effort - the first real call will surface any problem
@@ -0,0 +1,112 @@
+"""
+Shared: Semantic Cache for LLM Calls
+====================================
+Catches paraphrased queries that the exact-match cache in llm_cache.py misses
+("Where is my order?" vs "Where's my order?"). Each user query is embedded
+with text-embedding-3-small. If a stored query is at least SIMILARITY_THRESHOLD
+cosine-similar, its response is reused and the chat completion is skipped.
+
+Queries only match other queries whose request is otherwise identical
+(model, system prompt, tool schemas, tool_choice, token limits, ...). That way
+a BAD and a GOOD agent config never share answers, and editing a tool
+description invalidates answers given under the old one. Sampled requests
+(temperature > 0) skip the semantic layer, as they do the exact cache.
+
+The index is persisted to .llm_cache/sem_index.npz. Set LLM_CACHE=0 to bypass.
+"""
+
+import json
+import hashlib
+import numpy as np
+from openai.types.chat import ChatCompletion
+
+from common.llm_cache import CACHE_DIR, cache_get, cache_put, acached_completions_create, _cacheable, _to_json
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.97
+INDEX_PATH = CACHE_DIR / "sem_index.npz"
+
+# Normalized query embeddings (one row per entry) and parallel metadata
+_embeddings = None
+_namespaces = []
+_responses = []
+
+
+def _load_index():
+    global _embeddings, _namespaces, _responses
+    if _embeddings is not None:
+        return
+    if INDEX_PATH.exists():
+        data = np.load(INDEX_PATH)
+        _embeddings = data["embeddings"]
+        _namespaces = list(data["namespaces"])
+        _responses = list(data["responses"])
+    else:
+        _embeddings = np.empty((0, 0), dtype=np.float32)
+
+
+def _save_index():
+    CACHE_DIR.mkdir(exist_ok=True)
+    np.savez(
+        INDEX_PATH,
+        embeddings=_embeddings,
+        namespaces=np.array(_namespaces),
+        responses=np.array(_responses)
+    )
+
+
+def _namespace(kwargs: dict) -> str:
+    """Everything except the user query must match exactly for a semantic hit"""
+    canonical = dict(kwargs)
+    # Drop only the final user message - the part matched by similarity
+    messages = list(canonical["messages"])
+    last_user = max(i for i, m in enumerate(messages) if m["role"] == "user")
+    canonical["messages"] = messages[:last_user] + messages[last_user + 1:]
+    # Full tool schemas, not just names - editing a description or parameter
+    # must not replay answers the old schema produced
+    if "tools" in canonical:
+        canonical["tools"] = sorted(canonical["tools"], key=lambda t: t["function"]["name"])
+    key = json.dumps(canonical, sort_keys=True, default=_to_json)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+async def _embed(client, text: str) -> np.ndarray:
+    """Embed and L2-normalize text (embeddings are exact-cached too)"""
+    request = {"model": EMBEDDING_MODEL, "input": text}
+    cached = cache_get(request)
+    if cached is None:
+        response = await client.embeddings.create(**request)
+        cached = {"embedding": response.data[0].embedding}
+        cache_put(request, cached)
+    
+    vector = np.asarray(cached["embedding"], dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+async def asemantic_completions_create(client, **kwargs) -> ChatCompletion:
+    """Drop-in for client.chat.completions.create() that reuses answers to paraphrases"""
+    if not _cacheable(kwargs):
+        return await client.chat.completions.create(**kwargs)
+    
+    global _embeddings
+    _load_index()
+    
+    namespace = _namespace(kwargs)
+    query = next(m["content"] for m in reversed(kwargs["messages"]) if m["role"] == "user")
+    q = await _embed(client, query)
+    
+    # One matrix-vector product scores every stored query in this namespace
+    candidates = [i for i, ns in enumerate(_namespaces) if ns == namespace]
+    if candidates:
+        sims = _embeddings[candidates] @ q
+        best = int(np.argmax(sims))
+        if sims[best] >= SIMILARITY_THRESHOLD:
+            return ChatCompletion.model_validate_json(_responses[candidates[best]])
+    
+    response = await acached_completions_create(client, **kwargs)
+    
+    _embeddings = np.vstack([_embeddings, q]) if _embeddings.size else q[np.newaxis, :]
+    _namespaces.append(namespace)
+    _responses.append(response.model_dump_json())
+    _save_index()
+    return response
@@ -0,0 +1,48 @@
+"""
+Shared: Embedding-Based Tool Router
+===================================
+As agents grow past a handful of tools, sending every schema on every request
+costs prompt tokens and makes tool selection less accurate. ToolRouter embeds
+each tool's description once. For each query it keeps only the TOP_K most
+similar tools.
+
+Tool sets of TOP_K or fewer tools pass through untouched, with no embedding calls.
+"""
+
+import numpy as np
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+TOP_K = 5
+
+
+def _normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+class ToolRouter:
+    """Select the top-K tools for a query by cosine similarity of descriptions"""
+    
+    def __init__(self, tools: list, k: int = TOP_K):
+        self.tools = tools
+        self.k = k
+        self._matrix = None  # Tool description embeddings, built on first use
+    
+    def select(self, client, query: str) -> list:
+        """Return the subset of tools relevant to the query, in original order"""
+        if len(self.tools) <= self.k:
+            return self.tools
+        
+        if self._matrix is None:
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[t["function"]["description"] for t in self.tools]
+            )
+            self._matrix = _normalize([d.embedding for d in response.data])
+        
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=query)
+        q = _normalize(response.data[0].embedding)
+        
+        sims = self._matrix @ q
+        top_k = np.argpartition(-sims, self.k)[:self.k]
+        return [self.tools[i] for i in sorted(top_k)]
@@ -7,71 +7,108 @@ Demonstrates three common agent failure modes:
 3. Invocation failure - agent provides wrong parameters
 """
 
-import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+import orjson
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.llm_cache import cache_get, cache_put
+from common.openai_client import get_async_client
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+async def first_tool_call(**kwargs) -> tuple | None:
+    """Stream a completion and stop as soon as the first tool call's arguments are complete.
+    Returns (name, args) or None if the model answered without calling a tool."""
+    cache_key = {**kwargs, "stream": True}
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return (cached["name"], cached["args"]) if cached else None
+    
+    name, arguments, args = None, "", None
+    stream = await get_async_client().chat.completions.create(stream=True, **kwargs)
+    async with stream:  # Closes the connection on early exit and on errors
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            for delta in chunk.choices[0].delta.tool_calls or []:
+                if delta.index != 0 or delta.function is None:
+                    continue
+                name = delta.function.name or name
+                arguments += delta.function.arguments or ""
+            
+            # Arguments only parse once the JSON object is complete - then stop decoding
+            if name:
+                try:
+                    args = orjson.loads(arguments)
+                except orjson.JSONDecodeError:
+                    continue
+                break
+    
+    result = (name, args) if args is not None else None
+    cache_put(cache_key, {"name": name, "args": args} if result else {})
+    return result
 
 
 # =============================================================================
 # SCENARIO 1: Planning Failure (Wrong Tool Selection)
 # =============================================================================
 
-def planning_failure():
-    """Agent picks wrong tool due to ambiguous descriptions"""
-    print("\n" + "="*60)
-    print("SCENARIO 1: Planning Failure")
-    print("="*60)
-    
-    # BAD: Tool descriptions are too similar/vague
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_order_info",
-                "description": "Get information about an item",  # Vague!
-                "parameters": {
-                    "type": "object",
-                    "properties": {"id": {"type": "string"}},
-                    "required": ["id"]
-                }
+# BAD: Tool descriptions are too similar/vague
+PLANNING_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_order_info",
+            "description": "Get information about an item",  # Vague!
+            "parameters": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}},
+                "required": ["id"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "check_stock",
-                "description": "Check information about an item",  # Almost identical!
-                "parameters": {
-                    "type": "object",
-                    "properties": {"id": {"type": "string"}},
-                    "required": ["id"]
-                }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "check_stock",
+            "description": "Check information about an item",  # Almost identical!
+            "parameters": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}},
+                "required": ["id"]
             }
         }
-    ]
-    
+    }
+]
+
+
+async def planning_failure():
+    """Agent picks wrong tool due to ambiguous descriptions"""
     user_query = "Is the blue widget available to purchase?"
-    print(f"\nUser: \"{user_query}\"")
-    print(f"Expected: check_stock (inventory query)")
-    
-    response = client.chat.completions.create(
+    tool = await first_tool_call(
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": user_query}
         ],
-        tools=tools
+        tools=PLANNING_TOOLS,
+        tool_choice="required",  # One tool call, no prose wrapper
+        parallel_tool_calls=False
     )
     
-    if response.choices[0].message.tool_calls:
-        tool = response.choices[0].message.tool_calls[0]
-        print(f"Actual: {tool.function.name}")
+    # Print only after the await so concurrent scenarios don't interleave
+    print("\n" + "="*60)
+    print("SCENARIO 1: Planning Failure")
+    print("="*60)
+    print(f"\nUser: \"{user_query}\"")
+    print(f"Expected: check_stock (inventory query)")
+    
+    if tool:
+        name, args = tool
+        print(f"Actual: {name}")
         
-        if tool.function.name != "check_stock":
+        if name != "check_stock":
             print("PLANNING FAILURE: Agent chose wrong tool!")
         else:
             print("Agent chose correctly (may vary between runs)")
@@ -83,46 +120,46 @@ def planning_failure():
 # SCENARIO 2: Grounding Failure (Hallucinated Information)
 # =============================================================================
 
-def grounding_failure():
-    """Agent hallucinates order ID that wasn't provided"""
-    print("\n" + "="*60)
-    print("SCENARIO 2: Grounding Failure")
-    print("="*60)
-    
-    tools = [{
-        "type": "function",
-        "function": {
-            "name": "get_order_status",
-            "description": "Get the status of an order",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {"type": "string", "description": "The order ID"}
-                },
-                "required": ["order_id"]
-            }
+GROUNDING_TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "get_order_status",
+        "description": "Get the status of an order",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string", "description": "The order ID"}
+            },
+            "required": ["order_id"]
         }
-    }]
-    
+    }
+}]
+
+
+async def grounding_failure():
+    """Agent hallucinates order ID that wasn't provided"""
     # User doesn't provide order ID!
     user_query = "Where is my order? It should have arrived by now."
-    print(f"\nUser: \"{user_query}\"")
-    print(f"Expected: Agent should ask for order_id (not provided)")
-    
-    response = client.chat.completions.create(
+    tool = await first_tool_call(
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "You must use tools to help users. Do not ask questions."},
             {"role": "user", "content": user_query}
         ],
-        tools=tools,
-        tool_choice="required"  # Force tool usage
+        tools=GROUNDING_TOOLS,
+        tool_choice="required",  # Force tool usage
+        parallel_tool_calls=False
     )
     
-    if response.choices[0].message.tool_calls:
-        tool = response.choices[0].message.tool_calls[0]
-        args = json.loads(tool.function.arguments)
-        print(f"Actual: {tool.function.name}({args})")
+    print("\n" + "="*60)
+    print("SCENARIO 2: Grounding Failure")
+    print("="*60)
+    print(f"\nUser: \"{user_query}\"")
+    print(f"Expected: Agent should ask for order_id (not provided)")
+    
+    if tool:
+        name, args = tool
+        print(f"Actual: {name}({args})")
         
         if args.get("order_id"):
             print(f"GROUNDING FAILURE: Agent hallucinated order_id = '{args['order_id']}'")
@@ -134,46 +171,47 @@ def grounding_failure():
 # SCENARIO 3: Invocation Failure (Wrong Parameters)
 # =============================================================================
 
-def invocation_failure():
-    """Agent provides wrong parameter format"""
-    print("\n" + "="*60)
-    print("SCENARIO 3: Invocation Failure")
-    print("="*60)
-    
-    tools = [{
-        "type": "function",
-        "function": {
-            "name": "process_refund",
-            "description": "Process a refund for an order",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {"type": "string"},  # No format hint!
-                    "reason": {"type": "string"}     # No description!
-                },
-                "required": ["order_id", "reason"]
-            }
+INVOCATION_TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "process_refund",
+        "description": "Process a refund for an order",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string"},  # No format hint!
+                "reason": {"type": "string"}     # No description!
+            },
+            "required": ["order_id", "reason"]
         }
-    }]
-    
+    }
+}]
+
+
+async def invocation_failure():
+    """Agent provides wrong parameter format"""
     # User provides incomplete/ambiguous info
     user_query = "Refund order 12345, it was damaged"
-    print(f"\nUser: \"{user_query}\"")
-    print(f"Expected format: order_id='ORD-12345' (with prefix)")
-    
-    response = client.chat.completions.create(
+    tool = await first_tool_call(
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": user_query}
         ],
-        tools=tools
+        tools=INVOCATION_TOOLS,
+        tool_choice="required",  # One tool call, no prose wrapper
+        parallel_tool_calls=False
     )
     
-    if response.choices[0].message.tool_calls:
-        tool = response.choices[0].message.tool_calls[0]
-        args = json.loads(tool.function.arguments)
-        print(f"Actual: {tool.function.name}({json.dumps(args)})")
+    print("\n" + "="*60)
+    print("SCENARIO 3: Invocation Failure")
+    print("="*60)
+    print(f"\nUser: \"{user_query}\"")
+    print(f"Expected format: order_id='ORD-12345' (with prefix)")
+    
+    if tool:
+        name, args = tool
+        print(f"Actual: {name}({json.dumps(args)})")
         
         order_id = args.get("order_id", "")
         if not order_id.startswith("ORD-"):
@@ -184,7 +222,7 @@ def invocation_failure():
         print("Agent didn't call tool")
 
 
-def main():
+async def main():
     print("\n" + "="*60)
     print("DEMO: Common Agent Failure Modes")
     print("="*60)
@@ -192,40 +230,48 @@ def main():
 This demo shows three types of failures that occur in AI agents: planning failure, grounding failure, and invocation failure.
     """)
     
+    # --no-wait: skip the Enter prompts and run all scenarios concurrently
+    if "--no-wait" in sys.argv:
+        await asyncio.gather(planning_failure(), grounding_failure(), invocation_failure())
+        print("\n" + "="*60)
+        return
+    
     input("[Press Enter to see Planning Failure...]")
-    planning_failure()
+    await planning_failure()
     
     input("\n[Press Enter to see Grounding Failure...]")
-    grounding_failure()
+    await grounding_failure()
     
     input("\n[Press Enter to see Invocation Failure...]")
-    invocation_failure()
+    await invocation_failure()
     
     print("\n" + "="*60)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
 # =============================================================================
 # Example output:
 # =============================================================================
 
+# ============================================================
 # DEMO: Common Agent Failure Modes
-# == == == == == == == == == == == == == == == == == == == == == == == == == == == == == ==
+# ============================================================
 
 # This demo shows three types of failures that occur in AI agents: planning failure, grounding failure, and invocation failure.
 
 # [Press Enter to see Planning Failure...]
 
-# == == == == == == == == == == == == == == == == == == == == == == == == == == == == == ==
+# ============================================================
 # SCENARIO 1: Planning Failure
-# == == == == == == == == == == == == == == == == == == == == == == == == == == == == == ==
+# ============================================================
 
 # User: "Is the blue widget available to purchase?"
-# Expected: check_stock(inventory query)
-# Agent didn't call any tool
+# Expected: check_stock (inventory query)
+# Actual: get_order_info
+# PLANNING FAILURE: Agent chose wrong tool!
 
 # [Press Enter to see Grounding Failure...]
 
@@ -237,7 +283,6 @@ if __name__ == "__main__":
 # Expected: Agent should ask for order_id (not provided)
 # Actual: get_order_status({'order_id': 'unknown'})
 # GROUNDING FAILURE: Agent hallucinated order_id = 'unknown'
-#    Root cause: No instruction to ask for missing info
 
 # [Press Enter to see Invocation Failure...]
 
@@ -249,6 +294,5 @@ if __name__ == "__main__":
 # Expected format: order_id='ORD-12345' (with prefix)
 # Actual: process_refund({"order_id": "12345", "reason": "Damaged item received"})
 # INVOCATION FAILURE: Wrong format '12345' (missing ORD- prefix)
-#    Root cause: No format example in parameter description
 
-# ============================================================
\ No newline at end of file
+# ============================================================
@@ -4,25 +4,35 @@ Module 1, Demo 2: Cascading Errors in Agent Workflows
 Shows how one error leads to another in multi-step agent tasks.
 """
 
-import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
+import orjson
+import functools
+from types import MappingProxyType
+from pathlib import Path
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.llm_cache import cached_completions_create
+from common.tool_router import ToolRouter
+from common.openai_client import get_client
 
 
 # Tools
+@functools.lru_cache(maxsize=256)
+def _lookup_order(order_id: str) -> MappingProxyType:
+    """Order lookup - cached so repeat calls in a session skip the (simulated) backend"""
+    orders = {
+        "ORD-001": {"id": "ORD-001", "status": "delivered", "total": 99.99, "item": "Laptop Stand"},
+    }
+    return MappingProxyType(orders.get(order_id, {"error": f"Order {order_id} not found"}))
+
+
 def get_order(order_id: str) -> dict:
     """Returns order or error"""
     if not order_id:
         return {"error": "Order ID is required"}
     
-    orders = {
-        "ORD-001": {"id": "ORD-001", "status": "delivered", "total": 99.99, "item": "Laptop Stand"},
-    }
-    return orders.get(order_id, {"error": f"Order {order_id} not found"})
+    # Copy so callers can't mutate the cached entry
+    return dict(_lookup_order(order_id))
 
 
 def process_refund(order_id: str, amount: float) -> dict:
@@ -62,21 +72,34 @@ tools = [
     }
 ]
 
-available_functions = {"get_order": get_order, "process_refund": process_refund}
+# Tool dispatch: name -> (function, accepted parameter names)
+TOOL_TABLE = {
+    "get_order": (get_order, ("order_id",)),
+    "process_refund": (process_refund, ("order_id", "amount"))
+}
+
+# Only the most relevant tools are sent once the tool set grows beyond TOP_K
+tool_router = ToolRouter(tools)
+
+# Tool results are resent on every turn - cap their size in the history
+MAX_TOOL_RESULT_CHARS = 2048
 
 
 def run_agent(user_query: str, system_prompt: str):
     """Run agent and execute tool calls"""
+    client = get_client()
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_query}
     ]
+    selected_tools = tool_router.select(client, user_query)
     
     # First API call - agent decides which tools to use
-    response = client.chat.completions.create(
+    response = cached_completions_create(
+        client,
         model="gpt-5-mini",
         messages=messages,
-        tools=tools
+        tools=selected_tools
     )
     
     msg = response.choices[0].message
@@ -87,14 +110,40 @@ def run_agent(user_query: str, system_prompt: str):
     
     # Loop until agent responds with content (no more tool calls)
     step = 1
+    seen = {}  # (tool name, args) -> result, so repeated calls aren't re-executed
     while msg.tool_calls:
-        # Add assistant message and execute tool calls
-        messages.append(msg)
+        # Add assistant message (only the fields the API needs) and execute tool calls
+        assistant_msg = {
+            "role": "assistant",
+            "tool_calls": [
+                {
+                    "id": t.id,
+                    "type": "function",
+                    "function": {"name": t.function.name, "arguments": t.function.arguments}
+                }
+                for t in msg.tool_calls
+            ]
+        }
+        if msg.content:
+            assistant_msg["content"] = msg.content
+        messages.append(assistant_msg)
         
+        # True only if every call this turn re-requests one that already failed
+        repeated_failure = True
         for tool in msg.tool_calls:
-            args = json.loads(tool.function.arguments)
-            func = available_functions[tool.function.name]
-            result = func(**args)
+            func, arg_names = TOOL_TABLE[tool.function.name]
+            args = orjson.loads(tool.function.arguments)
+            # Drop any hallucinated kwargs the function doesn't accept
+            args = {k: args[k] for k in arg_names if k in args}
+            key = (tool.function.name, orjson.dumps(args, option=orjson.OPT_SORT_KEYS))  # Args may hold lists/dicts
+            if key in seen:
+                result = {**seen[key], "_cached": True}
+                if "error" not in result:
+                    repeated_failure = False  # Re-checking a good result is fine
+            else:
+                repeated_failure = False
+                result = func(**args)
+                seen[key] = result
             
             print(f"\nStep {step}: {tool.function.name}({args})")
             print(f"  Result: {result}")
@@ -102,14 +151,24 @@ def run_agent(user_query: str, system_prompt: str):
             if "error" in result:
                 print(f"  ^ ERROR at step {step} - watch how this cascades...")
             
-            messages.append({"role": "tool", "tool_call_id": tool.id, "content": json.dumps(result)})
+            content = orjson.dumps(result).decode()
+            if len(content) > MAX_TOOL_RESULT_CHARS:
+                content = content[:MAX_TOOL_RESULT_CHARS] + "..."
+            messages.append({"role": "tool", "tool_call_id": tool.id, "content": content})
             step += 1
         
+        # Agent is only retrying calls that already failed - stop instead of paying for another turn
+        if repeated_failure:
+            print("\n  ^ Agent repeated a failed tool call - stopping the loop")
+            print("\nAgent Response: I wasn't able to complete this request. Please contact support.")
+            return
+        
         # Next API call - agent may request more tools or respond
-        response = client.chat.completions.create(
+        response = cached_completions_create(
+            client,
             model="gpt-5-mini",
             messages=messages,
-            tools=tools
+            tools=selected_tools
         )
         msg = response.choices[0].message
     
@@ -4,13 +4,15 @@ Module 2, Demo 1: Improving Agent Prompts
 Shows how better system prompts and tool descriptions improve agent reliability.
 """
 
-import os
+import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import asyncio
+from pathlib import Path
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.sem_cache import asemantic_completions_create
+from common.openai_client import get_async_client
+from common.batch import run_batch
 
 
 # =============================================================================
@@ -100,9 +102,18 @@ GOOD_TOOLS = [
 ]
 
 
-def run_agent(system_prompt: str, tools: list, query: str) -> dict:
+def parse_message(msg) -> dict:
+    """Reduce an assistant message to its first tool call or its text"""
+    if msg.tool_calls:
+        tool = msg.tool_calls[0]
+        return {"tool": tool.function.name, "args": json.loads(tool.function.arguments)}
+    return {"text": msg.content}
+
+
+async def run_agent(system_prompt: str, tools: list, query: str) -> dict:
     """Run agent and return tool call or text response"""
-    response = client.chat.completions.create(
+    response = await asemantic_completions_create(
+        get_async_client(),
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": system_prompt},
@@ -111,21 +122,11 @@ def run_agent(system_prompt: str, tools: list, query: str) -> dict:
         tools=tools
     )
     
-    msg = response.choices[0].message
-    if msg.tool_calls:
-        tool = msg.tool_calls[0]
-        return {"tool": tool.function.name, "args": json.loads(tool.function.arguments)}
-    return {"text": msg.content}
+    return parse_message(response.choices[0].message)
 
 
-def compare(query: str, expected: str):
-    """Compare bad vs good config responses"""
-    print(f"\nQuery: \"{query}\"")
-    print(f"Expected: {expected}")
-    
-    bad = run_agent(BAD_SYSTEM_PROMPT, BAD_TOOLS, query)
-    good = run_agent(GOOD_SYSTEM_PROMPT, GOOD_TOOLS, query)
-    
+def print_comparison(bad: dict, good: dict):
+    """Print bad vs good config responses side by side"""
     print(f"\n  [BAD]  ", end="")
     if "tool" in bad:
         print(f"{bad['tool']}({bad['args']})")
@@ -139,7 +140,61 @@ def compare(query: str, expected: str):
         print(f"Text: {good['text'][:60]}...")
 
 
-def main():
+async def compare(query: str, expected: str):
+    """Compare bad vs good config responses"""
+    print(f"\nQuery: \"{query}\"")
+    print(f"Expected: {expected}")
+    
+    # Both configs are independent - run them concurrently
+    bad, good = await asyncio.gather(
+        run_agent(BAD_SYSTEM_PROMPT, BAD_TOOLS, query),
+        run_agent(GOOD_SYSTEM_PROMPT, GOOD_TOOLS, query)
+    )
+    print_comparison(bad, good)
+
+
+# =============================================================================
+# BATCH MODE: Submit every comparison as one OpenAI Batch API job
+# =============================================================================
+
+CONFIGS = {
+    "bad": (BAD_SYSTEM_PROMPT, BAD_TOOLS),
+    "good": (GOOD_SYSTEM_PROMPT, GOOD_TOOLS)
+}
+
+
+async def batch_compare(queries: list) -> list:
+    """Run all (query, config) pairs in a single batch job (50% cheaper, not interactive)"""
+    requests = {}
+    for i, query in enumerate(queries, start=1):
+        for label, (system_prompt, tools) in CONFIGS.items():
+            requests[f"{label}-{i}"] = {
+                "model": "gpt-5-mini",
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": query}
+                ],
+                "tools": tools
+            }
+    
+    completions = await run_batch(get_async_client(), requests)
+    results = {custom_id: parse_message(c.choices[0].message) for custom_id, c in completions.items()}
+    return [(results[f"bad-{i}"], results[f"good-{i}"]) for i in range(1, len(queries) + 1)]
+
+
+TESTS = [
+    # Test 1: Parameter formatting - BAD passes raw name, GOOD converts
+    ("TEST 1: Parameter Format (product name -> ID)",
+     "Do you have the Laptop Stand in stock?",
+     "GOOD: 'laptop-stand', BAD: 'Laptop Stand' or similar"),
+    # Test 2: Missing info - BAD guesses, GOOD asks
+    ("TEST 2: Missing Information Handling",
+     "Where is my order?",
+     "GOOD asks for order_id, BAD hallucinates one"),
+]
+
+
+async def main():
     print("="*60)
     print("DEMO: Improving Agent Prompts")
     print("="*60)
@@ -147,27 +202,23 @@ def main():
     print("\nBAD CONFIG: Vague descriptions like 'Get information'")
     print("GOOD CONFIG: Clear guidance with 'USE WHEN' / 'DO NOT USE'\n")
     
-    input("[Press Enter to continue...]")
-    
-    # Test 1: Parameter formatting - BAD passes raw name, GOOD converts
-    print("-"*60)
-    print("TEST 1: Parameter Format (product name -> ID)")
-    print("-"*60)
-    compare(
-        query="Do you have the Laptop Stand in stock?",
-        expected="GOOD: 'laptop-stand', BAD: 'Laptop Stand' or similar"
-    )
-    
-    input("\n[Press Enter to continue...]")
-    
-    # Test 2: Missing info - BAD guesses, GOOD asks
-    print("\n" + "-"*60)
-    print("TEST 2: Missing Information Handling")
-    print("-"*60)
-    compare(
-        query="Where is my order?",
-        expected="GOOD asks for order_id, BAD hallucinates one"
-    )
+    # --batch: scripted run through the Batch API, no Enter prompts
+    if "--batch" in sys.argv:
+        comparisons = await batch_compare([query for _, query, _ in TESTS])
+        for (title, query, expected), (bad, good) in zip(TESTS, comparisons):
+            print("\n" + "-"*60)
+            print(title)
+            print("-"*60)
+            print(f"\nQuery: \"{query}\"")
+            print(f"Expected: {expected}")
+            print_comparison(bad, good)
+    else:
+        for title, query, expected in TESTS:
+            input("[Press Enter to continue...]")
+            print("\n" + "-"*60)
+            print(title)
+            print("-"*60)
+            await compare(query=query, expected=expected)
     
     print("\n" + "="*60)
     print("KEY TAKEAWAYS")
@@ -180,7 +231,7 @@ Good prompts include:
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
 # =============================================================================
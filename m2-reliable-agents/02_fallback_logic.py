@@ -5,186 +5,311 @@ This demo shows how to add error handling, retry logic, and
 graceful degradation to make agents more reliable.
 """
 
-import os
-import json
-import time
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-def get_order_status(order_id: str, simulate_error: str = None) -> dict:
+import sys
+import random
+import orjson
+import msgspec
+import asyncio
+import contextvars
+import fastjsonschema
+from pathlib import Path
+from types import MappingProxyType
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.openai_client import get_async_client, warmup
+from _tool_schemas import GET_ORDER_STATUS_TOOL, CHECK_INVENTORY_TOOL
+
+# In --batch mode scenarios run concurrently; each buffers its output here
+# and main() prints the blocks in scenario order, so lines never interleave
+_output = contextvars.ContextVar("output", default=None)
+
+
+def log(*args, end: str = "\n"):
+    """print() that buffers into the current scenario's output in --batch mode"""
+    text = " ".join(str(a) for a in args) + end
+    buffer = _output.get()
+    if buffer is None:
+        print(text, end="", flush=True)
+    else:
+        buffer.append(text)
+
+
+# Tool result payloads - frozen structs are cheap to build, encode straight
+# to JSON, and are safe to share between concurrent scenarios
+class OrderStatus(msgspec.Struct, frozen=True, gc=False):
+    order_id: str
+    status: str
+    items: tuple[str, ...]
+
+
+class ProductStock(msgspec.Struct, frozen=True, gc=False):
+    product_id: str
+    name: str
+    in_stock: bool
+    quantity: int
+
+
+class ToolError(msgspec.Struct, frozen=True, gc=False, omit_defaults=True):
+    error: str
+    message: str
+    retryable: bool = False
+    original_error: str | None = None  # Set when retries are exhausted
+
+
+# Simulated backend data - built once at import and read-only
+_ORDERS = MappingProxyType({
+    "ORD-12345": OrderStatus(order_id="ORD-12345", status="delivered", items=("Blue Widget",)),
+    "ORD-67890": OrderStatus(order_id="ORD-67890", status="in_transit", items=("Green Tool",))
+})
+
+_INVENTORY = MappingProxyType({
+    "blue-widget": ProductStock(product_id="blue-widget", name="Blue Widget", in_stock=True, quantity=45),
+    "green-tool": ProductStock(product_id="green-tool", name="Green Tool", in_stock=False, quantity=0)
+})
+
+
+def get_order_status(order_id: str, simulate_error: str = None) -> OrderStatus | ToolError:
     """Get order status - can simulate various errors for testing"""
 
     # Simulate different error types
     if simulate_error == "timeout":
-        return {"error": "timeout", "message": "Request timed out", "retryable": True}
+        return ToolError(error="timeout", message="Request timed out", retryable=True)
     if simulate_error == "service_unavailable":
-        return {"error": "service_unavailable", "message": "Service temporarily unavailable", "retryable": True}
+        return ToolError(error="service_unavailable", message="Service temporarily unavailable", retryable=True)
     
     # Real logic
-    orders = {
-        "ORD-12345": {"order_id": "ORD-12345", "status": "delivered", "items": ["Blue Widget"]},
-        "ORD-67890": {"order_id": "ORD-67890", "status": "in_transit", "items": ["Green Tool"]}
-    }
-    return orders.get(order_id, {"error": "not_found", "message": f"Order {order_id} not found", "retryable": False})
+    order = _ORDERS.get(order_id)
+    if order is None:
+        return ToolError(error="not_found", message=f"Order {order_id} not found")
+    return order
 
 
-def check_inventory(product_id: str, simulate_error: str = None) -> dict:
+def check_inventory(product_id: str, simulate_error: str = None) -> ProductStock | ToolError:
     """Check product inventory"""
     if simulate_error == "rate_limit":
-        return {"error": "rate_limit", "message": "Too many requests", "retryable": True}
+        return ToolError(error="rate_limit", message="Too many requests", retryable=True)
     
-    inventory = {
-        "blue-widget": {"product_id": "blue-widget", "name": "Blue Widget", "in_stock": True, "quantity": 45},
-        "green-tool": {"product_id": "green-tool", "name": "Green Tool", "in_stock": False, "quantity": 0}
-    }
-    return inventory.get(product_id, {"error": "not_found", "message": f"Product {product_id} not found", "retryable": False})
-
-
-# Tool schemas
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_order_status",
-            "description": "Retrieve order status. Use when customer asks about order delivery or tracking.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {"type": "string", "description": "Order identifier (ORD-XXXXX)"}
-                },
-                "required": ["order_id"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "check_inventory",
-            "description": "Check if a product is in stock.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "product_id": {"type": "string", "description": "Product identifier"}
-                },
-                "required": ["product_id"]
-            }
-        }
-    }
-]
+    product = _INVENTORY.get(product_id)
+    if product is None:
+        return ToolError(error="not_found", message=f"Product {product_id} not found")
+    return product
+
+
+# Tool schemas (shared with the stress tests; this demo has no refund tool)
+tools = [GET_ORDER_STATUS_TOOL, CHECK_INVENTORY_TOOL]
 
 available_functions = {
     "get_order_status": get_order_status,
     "check_inventory": check_inventory
 }
 
+# Argument validators compiled once from the tool schemas. Unknown keys are
+# rejected too, so a hallucinated kwarg can't reach func(**args) as a TypeError
+_VALIDATORS = {
+    tool["function"]["name"]: fastjsonschema.compile(
+        {**tool["function"]["parameters"], "additionalProperties": False}
+    )
+    for tool in tools
+}
+
+# Static prefix (system prompt + tools) must stay byte-identical across calls
+# so OpenAI's automatic prompt caching can reuse it
+SYSTEM_PROMPT = """You are a customer support agent for Globomantics.
+Use get_order_status for order questions and check_inventory for stock questions.
+Be helpful and concise."""
+
+
+# Output cap for the tool-decision call. gpt-5-mini's hidden reasoning tokens
+# count toward it, so it sits well above the ~50-token tool call / clarification
+MAX_DECISION_TOKENS = 1024
+
+# Retry backoff bounds (seconds)
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 10.0
 
-def execute_with_retry(func, args: dict, max_retries: int = 3) -> dict:
-    """Execute function with exponential backoff retry for transient errors"""
 
+async def execute_with_retry(func, args: dict, max_retries: int = 3) -> msgspec.Struct:
+    """Execute function with decorrelated-jitter backoff retry for transient errors"""
+
+    prev_wait = BACKOFF_BASE
     for attempt in range(max_retries):
-        result = func(**args)
+        # Tools are sync - run them off the event loop so a slow backend doesn't block other scenarios
+        result = await asyncio.to_thread(func, **args)
         
         # Success or non-retryable error - return immediately
-        if "error" not in result or not result.get("retryable"):
+        if not isinstance(result, ToolError) or not result.retryable:
             return result
         
+        # Out of retries - give up without waiting, but keep the underlying error
+        if attempt == max_retries - 1:
+            return msgspec.structs.replace(
+                result,
+                error="max_retries",
+                original_error=result.error,
+                message=f"Failed after {max_retries} attempts ({result.message})",
+                retryable=False
+            )
+        
         # Retryable error - wait and retry
-        if attempt < max_retries - 1:
-            wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
-            print(f"  Retryable error: {result['error']}")
-            print(f"  Waiting {wait_time}s before retry (attempt {attempt + 1}/{max_retries})...")
-            time.sleep(wait_time)
-    
-    return {"error": "max_retries", "message": f"Failed after {max_retries} attempts", "retryable": False}
+        # Decorrelated jitter: random wait between base and 3x the previous wait,
+        # so retries start fast and clients don't retry in lockstep
+        wait_time = random.uniform(BACKOFF_BASE, min(BACKOFF_CAP, prev_wait * 3))
+        prev_wait = wait_time
+        log(f"  Retryable error: {result.error}")
+        log(f"  Waiting {wait_time:.2f}s before retry (attempt {attempt + 1}/{max_retries})...")
+        await asyncio.sleep(wait_time)
+
+
+# User-facing fallback messages by error type - built once at import and read-only
+_FALLBACKS = MappingProxyType({
+    "not_found": "I couldn't find that. Please double-check the ID and try again.",
+    "timeout": "Our system is running slow. Would you like me to try again?",
+    "rate_limit": "We're experiencing high traffic. Please wait a moment.",
+    "service_unavailable": "Our system is temporarily unavailable. Try again in a few minutes.",
+    "max_retries": "I'm having trouble accessing our systems. Let me connect you with support@globomantics.com",
+    "validation": "I couldn't process that request. Could you rephrase it with the order or product ID?",
+    "truncated": "Sorry, I couldn't finish working that out. Could you ask again, a little more specifically?"
+})
+_DEFAULT_FALLBACK = "I encountered an issue. Please contact support@globomantics.com"
 
 
 def get_fallback_response(error: str) -> str:
     """Generate user-friendly fallback response based on error type"""
-    fallbacks = {
-        "not_found": "I couldn't find that. Please double-check the ID and try again.",
-        "timeout": "Our system is running slow. Would you like me to try again?",
-        "rate_limit": "We're experiencing high traffic. Please wait a moment.",
-        "service_unavailable": "Our system is temporarily unavailable. Try again in a few minutes.",
-        "max_retries": "I'm having trouble accessing our systems. Let me connect you with support@globomantics.com"
-    }
-    return fallbacks.get(error, "I encountered an issue. Please contact support@globomantics.com")
+    return _FALLBACKS.get(error, _DEFAULT_FALLBACK)
+
+
+def print_cache_usage(usage):
+    """Show how many prompt tokens were served from OpenAI's prompt cache"""
+    details = usage.prompt_tokens_details
+    cached = (details.cached_tokens or 0) if details else 0
+    log(f"[cache] {cached}/{usage.prompt_tokens} prompt tokens cached")
 
 
-def run_agent_with_fallback(user_message: str, simulate_error: str = None):
+async def run_agent_with_fallback(user_message: str, simulate_error: str = None):
     """Run agent with error handling and fallback logic"""
     
-    print(f"USER: {user_message}")
+    log(f"USER: {user_message}")
     if simulate_error:
-        print(f"[Simulating: {simulate_error}]")
-    
-    system_prompt = """You are a customer support agent for Globomantics.
-Use get_order_status for order questions and check_inventory for stock questions.
-Be helpful and concise."""
+        log(f"[Simulating: {simulate_error}]")
     
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_message}
     ]
     
     # Get agent decision
-    response = client.chat.completions.create(
+    client = get_async_client()
+    response = await client.chat.completions.create(
         model="gpt-5-mini",
         messages=messages,
-        tools=tools
+        tools=tools,
+        tool_choice="auto",
+        max_completion_tokens=MAX_DECISION_TOKENS
     )
+    print_cache_usage(response.usage)
+    
+    choice = response.choices[0]
+    response_message = choice.message
     
-    response_message = response.choices[0].message
+    # Hit the token cap (reasoning counts too) - no tool call and no usable text
+    if choice.finish_reason == "length":
+        log(f"\nError: truncated - no answer within {MAX_DECISION_TOKENS} completion tokens")
+        log(f"\nAgent: {get_fallback_response('truncated')}")
+        return
     
     # No tool call - just respond
     if not response_message.tool_calls:
-        print(f"\nAgent: {response_message.content}")
+        log(f"\nAgent: {response_message.content}")
         return
     
-    # Process tool call
-    tool_call = response_message.tool_calls[0]
-    function_name = tool_call.function.name
-    function_args = json.loads(tool_call.function.arguments)
-    
-    # Inject error simulation
-    if simulate_error:
-        function_args["simulate_error"] = simulate_error
-    
-    arg_id = function_args.get('order_id') or function_args.get('product_id')
-    print(f"\nCalling: {function_name}({arg_id})")
+    # Process tool calls
+    calls = []
+    for tool_call in response_message.tool_calls:
+        function_name = tool_call.function.name
+        function_args = orjson.loads(tool_call.function.arguments)
+        
+        # Reject malformed arguments before they reach the tool
+        try:
+            _VALIDATORS[function_name](function_args)
+        except fastjsonschema.JsonSchemaException as e:
+            log(f"\nError: validation - {function_name}: {e.message}")
+            log(f"\nAgent: {get_fallback_response('validation')}")
+            return
+        
+        # Inject error simulation (after validation - it's not a schema field)
+        if simulate_error:
+            function_args["simulate_error"] = simulate_error
+        
+        arg_id = function_args.get('order_id') or function_args.get('product_id')
+        log(f"\nCalling: {function_name}({arg_id})")
+        calls.append((tool_call, available_functions[function_name], function_args))
     
-    # Execute with retry logic
-    func = available_functions[function_name]
-    result = execute_with_retry(func, function_args)
+    # Execute with retry logic - independent tool calls run concurrently
+    results = await asyncio.gather(*(execute_with_retry(func, args) for _, func, args in calls))
     
     # Handle error with fallback
-    if "error" in result:
-        print(f"\nError: {result['error']} - {result['message']}")
-        print(f"\nAgent: {get_fallback_response(result['error'])}")
-        return
+    for result in results:
+        if isinstance(result, ToolError):
+            log(f"\nError: {result.error} - {result.message}")
+            # Prefer the underlying error (e.g. timeout) over the generic max_retries
+            log(f"\nAgent: {get_fallback_response(result.original_error or result.error)}")
+            return
     
     # Success - get final response
-    print(f"\nSuccess: {json.dumps(result, indent=2)}")
-    
     messages.append(response_message)
-    messages.append({
-        "role": "tool",
-        "tool_call_id": tool_call.id,
-        "content": json.dumps(result)
-    })
+    for (tool_call, _, _), result in zip(calls, results):
+        payload = msgspec.json.encode(result)
+        # Re-indent the already-encoded bytes for display (C path, no re-serialising)
+        log(f"\nSuccess: {msgspec.json.format(payload, indent=2).decode()}")
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": payload.decode()
+        })
     
-    final = client.chat.completions.create(model="gpt-5-mini", messages=messages)
-    print(f"\nAgent: {final.choices[0].message.content}")
-
-
-def main():
+    # Stream the reply so the user sees text at time-to-first-token
+    stream = await client.chat.completions.create(
+        model="gpt-5-mini",
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}  # Usage arrives in the final chunk
+    )
+    log("\nAgent: ", end="")
+    usage = None  # Missing if the stream ends early
+    async for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            log(chunk.choices[0].delta.content, end="")
+    log()
+    if usage:
+        print_cache_usage(usage)
+
+
+async def run_scenario(title: str, query: str, error: str = None):
+    """Run one scenario under its own header"""
+    log(f"\n{'-'*60}")
+    log(f"SCENARIO: {title}")
+    log(f"{'-'*60}\n")
+    await run_agent_with_fallback(query, error)
+
+
+async def run_scenario_buffered(title: str, query: str, error: str = None) -> str:
+    """Run one scenario concurrently with others, returning its output as one block"""
+    buffer = []
+    _output.set(buffer)  # Each gather task has its own context copy
+    await run_scenario(title, query, error)
+    return "".join(buffer)
+
+
+async def main():
     print("\n" + "="*60)
     print("DEMO: Fallback and Recovery Logic")
     print("="*60)
     
+    # Pay the connection handshake now rather than on the first scenario
+    await warmup()
+    
     scenarios = [
         ("Success", "Where is order ORD-12345?", None),
         ("Retryable - timeout", "Check order ORD-67890", "timeout"),
@@ -192,16 +317,20 @@ def main():
         ("Non-retryable - not found", "Where is order ORD-99999?", None),
     ]
     
+    # --batch: no Enter prompts, all scenarios run concurrently, printed in order
+    if "--batch" in sys.argv:
+        outputs = await asyncio.gather(*(run_scenario_buffered(t, q, e) for t, q, e in scenarios))
+        for output in outputs:
+            print(output, end="")
+        return
+    
     for title, query, error in scenarios:
-        print(f"\n{'-'*60}")
-        print(f"SCENARIO: {title}")
-        print(f"{'-'*60}\n")
-        run_agent_with_fallback(query, error)
+        await run_scenario(title, query, error)
         input("\n[Press Enter to continue...]")
     
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
 
 # =============================================================================
@@ -217,6 +346,7 @@ if __name__ == "__main__":
 # ------------------------------------------------------------
 
 # USER: Where is order ORD-12345?
+# [cache] 0/148 prompt tokens cached
 
 # Calling: get_order_status(ORD-12345)
 
@@ -229,6 +359,7 @@ if __name__ == "__main__":
 # }
 
 # Agent: Your order ORD-12345 has been delivered. It included a Blue Widget. If you have any further questions, feel free to ask!
+# [cache] 0/231 prompt tokens cached
 
 # [Press Enter to continue ...]
 
@@ -238,16 +369,17 @@ if __name__ == "__main__":
 
 # USER: Check order ORD-67890
 # [Simulating: timeout]
+# [cache] 0/146 prompt tokens cached
 
 # Calling: get_order_status(ORD-67890)
 #   Retryable error: timeout
-#   Waiting 1s before retry(attempt 1/3)...
+#   Waiting 0.24s before retry (attempt 1/3)...
 #   Retryable error: timeout
-#   Waiting 2s before retry(attempt 2/3)...
+#   Waiting 0.51s before retry (attempt 2/3)...
 
-# Error: max_retries - Failed after 3 attempts
+# Error: max_retries - Failed after 3 attempts (Request timed out)
 
-# Agent: I'm having trouble accessing our systems. Let me connect you with support@globomantics.com
+# Agent: Our system is running slow. Would you like me to try again?
 
 # [Press Enter to continue...]
 
@@ -257,16 +389,17 @@ if __name__ == "__main__":
 
 # USER: Is blue-widget in stock?
 # [Simulating: rate_limit]
+# [cache] 0/147 prompt tokens cached
 
 # Calling: check_inventory(blue-widget)
 #   Retryable error: rate_limit
-#   Waiting 1s before retry (attempt 1/3)...
+#   Waiting 0.17s before retry (attempt 1/3)...
 #   Retryable error: rate_limit
-#   Waiting 2s before retry (attempt 2/3)...
+#   Waiting 0.39s before retry (attempt 2/3)...
 
-# Error: max_retries - Failed after 3 attempts
+# Error: max_retries - Failed after 3 attempts (Too many requests)
 
-# Agent: I'm having trouble accessing our systems. Let me connect you with support@globomantics.com
+# Agent: We're experiencing high traffic. Please wait a moment.
 
 # [Press Enter to continue...]
 
@@ -275,6 +408,7 @@ if __name__ == "__main__":
 # ------------------------------------------------------------
 
 # USER: Where is order ORD-99999?
+# [cache] 0/148 prompt tokens cached
 
 # Calling: get_order_status(ORD-99999)
 
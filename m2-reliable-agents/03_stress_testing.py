@@ -4,97 +4,108 @@ Module 2, Demo 3: Stress Testing Agent Behavior
 Shows how to run automated tests to verify agent reliability.
 """
 
-import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-# Tool definitions
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_order_status",
-            "description": "Retrieve order status. Use when customer asks about order delivery or tracking.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {"type": "string", "description": "Order identifier (ORD-XXXXX)"}
-                },
-                "required": ["order_id"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "check_inventory",
-            "description": "Check if a product is in stock. Use for availability questions.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "product_id": {"type": "string", "description": "Product ID (lowercase-hyphen format)"}
-                },
-                "required": ["product_id"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "process_refund",
-            "description": "Process a refund. Use when customer explicitly requests return or refund.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "order_id": {"type": "string", "description": "Order identifier"},
-                    "reason": {"type": "string", "description": "Reason for refund"}
-                },
-                "required": ["order_id", "reason"]
-            }
-        }
-    }
-]
+import sys
+import asyncio
+import orjson
+from pathlib import Path
 
-SYSTEM_PROMPT = """You are a customer support agent for Globomantics.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.openai_client import get_async_client, warmup
+from common.llm_cache import acached_completions_create, stats as cache_stats
+from common.batch import run_batch
+from _tool_schemas import TOOLS, SYSTEM_PROMPT
 
-Tools:
-- get_order_status: Check order status (requires order_id)
-- check_inventory: Check product availability (requires product_id)
-- process_refund: Process refund (requires order_id and reason)
+# Cap in-flight API calls so concurrent tests don't trip rate limits
+MAX_CONCURRENT_TESTS = 5
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TESTS)
 
-Rules:
-1. If order_id is not provided, ASK for it - never guess
-2. Convert product names to IDs: "Blue Widget" -> "blue-widget"
-"""
+# Bounds worst-case latency per test. gpt-5-mini's hidden reasoning tokens
+# count toward it, so it sits well above the ~50-token tool call / clarification
+MAX_COMPLETION_TOKENS = 1024
+
+
+# =============================================================================
+# TEST CASES: (category title, [(name, query, expected_tool, expected_args)])
+# =============================================================================
+
+TEST_CATEGORIES = [
+    ("Tool Selection", [
+        ("Inventory check", "Is the blue widget in stock?", 
+         "check_inventory", {"product_id": "blue-widget"}),
+        ("Order tracking", "Where is my order ORD-12345?", 
+         "get_order_status", {"order_id": "ORD-12345"}),
+        ("Refund request", "I want to refund ORD-67890, it was damaged", 
+         "process_refund", {"order_id": "ORD-67890"}),
+    ]),
+    ("Missing Information Handling", [
+        ("No order ID", "I want to return my order", None, None),
+        ("No product", "Check if it's in stock", None, None),
+    ]),
+    ("Edge Cases", [
+        ("Terse query", "blue widget stock?", 
+         "check_inventory", {"product_id": "blue-widget"}),
+        ("Natural phrasing", "Do you have red gadgets available?", 
+         "check_inventory", {"product_id": "red-gadget"}),
+    ]),
+]
+
+# Flat (name, query, expected_tool, expected_args) list - parametrizes test_agent_behavior.py
+# and becomes one Batch API request per entry
+ALL_TESTS = [test for _, tests in TEST_CATEGORIES for test in tests]
+
+# Prompt-cache check: OpenAI only caches prompts of 1024+ tokens, so the
+# system prompt (~95 tokens) is repeated to ~1.5k tokens plus tools - a clear
+# margin. Caching is best effort, so a miss is retried once and only reported
+# in the summary - unless --require-prompt-cache makes it fail the run.
+CACHE_CHECK_TITLE = "Prompt-Cache Efficiency"
+CACHE_MIN_PROMPT_TOKENS = 1024
+CACHE_CHECK_PROMPT = SYSTEM_PROMPT * 16
+CACHE_CHECK_QUERIES = ("ping", "pong")
+CACHE_CHECK_ATTEMPTS = 2
 
 
 # =============================================================================
 # TEST RUNNER
 # =============================================================================
 
-def run_test(query: str, expected_tool: str = None, expected_args: dict = None) -> dict:
-    """Run a single test and return results"""
-    
-    response = client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
+def build_request(query: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+    """Chat completion request for a test query (static prefix first)"""
+    return {
+        "model": "gpt-5-mini",
+        "messages": [
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": query}
         ],
-        tools=tools
-    )
+        "tools": TOOLS,
+        "tool_choice": "auto",
+        "max_completion_tokens": MAX_COMPLETION_TOKENS
+    }
+
+
+def score_response(response, expected_tool: str = None, expected_args: dict = None) -> dict:
+    """Compare a completion against the expected tool call"""
+    choice = response.choices[0]
+    msg = choice.message
+    details = response.usage.prompt_tokens_details
+    usage = {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "cached_tokens": (details.cached_tokens or 0) if details else 0
+    }
     
-    msg = response.choices[0].message
+    # Ran out of completion tokens (reasoning counts too) - neither a tool
+    # call nor a clarifying question, so it must not pass as "no tool"
+    if choice.finish_reason == "length":
+        return {
+            "text": f"hit max_completion_tokens={MAX_COMPLETION_TOKENS} before answering",
+            "note": "Truncated",
+            "passed": False,
+            **usage
+        }
     
     if msg.tool_calls:
         tool = msg.tool_calls[0]
         actual_tool = tool.function.name
-        actual_args = json.loads(tool.function.arguments)
+        actual_args = orjson.loads(tool.function.arguments)
         
         # Check tool selection
         tool_match = (actual_tool == expected_tool) if expected_tool else True
@@ -110,96 +121,126 @@ def run_test(query: str, expected_tool: str = None, expected_args: dict = None)
         return {
             "tool": actual_tool,
             "args": actual_args,
-            "passed": tool_match and args_match
+            "passed": tool_match and args_match,
+            **usage
         }
     else:
-        # No tool call - pass if we expected no tool
+        # No tool call - pass if we expected no tool and the agent actually replied
+        return {
+            "text": (msg.content or "<empty reply>")[:60] + "...",
+            "passed": expected_tool is None and bool(msg.content),
+            **usage
+        }
+
+
+async def run_test(query: str, expected_tool: str = None, expected_args: dict = None) -> dict:
+    """Run a single test and return results"""
+    
+    async with _semaphore:
+        response = await acached_completions_create(get_async_client(), **build_request(query))
+    
+    return score_response(response, expected_tool, expected_args)
+
+
+async def run_cache_check() -> dict:
+    """Send requests with the same static prefix; a follow-up should hit the prompt cache"""
+    # Straight to the API (not the local disk cache) and in order - the
+    # first call has to land before a later one can reuse its prefix
+    client = get_async_client()
+    first_query, query = CACHE_CHECK_QUERIES
+    response = await client.chat.completions.create(**build_request(first_query, CACHE_CHECK_PROMPT))
+    
+    # A prompt under the minimum can never be cached - say so instead of reporting a miss
+    if response.usage.prompt_tokens < CACHE_MIN_PROMPT_TOKENS:
+        result = score_response(response)
         return {
-            "text": msg.content[:60] + "...",
-            "passed": expected_tool is None
+            "text": f"prompt is {result['prompt_tokens']} tokens (< {CACHE_MIN_PROMPT_TOKENS}), lengthen CACHE_CHECK_PROMPT",
+            "note": "Too short",
+            "passed": False,
+            "prompt_tokens": result["prompt_tokens"],
+            "cached_tokens": result["cached_tokens"]
         }
+    
+    for _ in range(CACHE_CHECK_ATTEMPTS):
+        response = await client.chat.completions.create(**build_request(query, CACHE_CHECK_PROMPT))
+        result = score_response(response)
+        result["passed"] = result["cached_tokens"] > 0
+        if result["passed"]:
+            break
+    return result
+
+
+async def run_tests_batch() -> list:
+    """Run every test as one Batch API job (50% cheaper; for offline/CI sweeps)"""
+    responses = await run_batch(
+        get_async_client(),
+        {name: build_request(query) for name, query, _, _ in ALL_TESTS}
+    )
+    return [
+        [score_response(responses[name], tool, args) for name, _, tool, args in tests]
+        for _, tests in TEST_CATEGORIES
+    ]
 
 
 def print_result(name: str, query: str, result: dict, expected: str):
-    """Print formatted test result"""
+    """Print formatted test result as one block (single stdout write)"""
     status = "PASS" if result["passed"] else "FAIL"
-    print(f"\n  {name}: {status}")
-    print(f"    Query: \"{query}\"")
-    print(f"    Expected: {expected}")
-    
     if "tool" in result:
-        print(f"    Actual: {result['tool']}({result['args']})")
+        actual = f"{result['tool']}({result['args']})"
+    elif "note" in result:
+        actual = f"[{result['note']}] {result['text']}"
     else:
-        print(f"    Actual: [No tool] {result['text']}")
+        actual = f"[No tool] {result['text']}"
+    sys.stdout.write(
+        f"\n  {name}: {status}\n"
+        f"    Query: \"{query}\"\n"
+        f"    Expected: {expected}\n"
+        f"    Actual: {actual}\n"
+        f"    [cache] {result['cached_tokens']}/{result['prompt_tokens']} prompt tokens cached\n"
+    )
 
 
-def main():
+async def main() -> bool:
     print("\n" + "="*60)
     print("DEMO: Stress Testing Agent Behavior")
     print("="*60)
     print("\nThis demo runs automated tests to verify agent reliability.")
     
-    results = []
-    
-    # -------------------------------------------------------------------------
-    # TEST CATEGORY 1: Tool Selection
-    # -------------------------------------------------------------------------
-    input("\n[Press Enter to run Tool Selection tests...]")
-    print("\n" + "-"*60)
-    print("CATEGORY 1: Tool Selection")
-    print("-"*60)
-    
-    tests = [
-        ("Inventory check", "Is the blue widget in stock?", 
-         "check_inventory", {"product_id": "blue-widget"}),
-        ("Order tracking", "Where is my order ORD-12345?", 
-         "get_order_status", {"order_id": "ORD-12345"}),
-        ("Refund request", "I want to refund ORD-67890, it was damaged", 
-         "process_refund", {"order_id": "ORD-67890"}),
-    ]
-    
-    for name, query, tool, args in tests:
-        result = run_test(query, tool, args)
-        results.append(result)
-        print_result(name, query, result, f"{tool}({args})")
+    # Pay the connection handshake now rather than on the first test
+    await warmup()
     
-    # -------------------------------------------------------------------------
-    # TEST CATEGORY 2: Missing Information Handling
-    # -------------------------------------------------------------------------
-    input("\n[Press Enter to run Missing Information tests...]")
-    print("\n" + "-"*60)
-    print("CATEGORY 2: Missing Information Handling")
-    print("-"*60)
+    # --batch: submit everything up front via the Batch API, no Enter prompts
+    batch_mode = "--batch" in sys.argv
+    if batch_mode:
+        category_results = await run_tests_batch()
     
-    tests = [
-        ("No order ID", "I want to return my order", None, None),
-        ("No product", "Check if it's in stock", None, None),
-    ]
+    results = []
+    for number, (title, tests) in enumerate(TEST_CATEGORIES, start=1):
+        if batch_mode:
+            batch = category_results[number - 1]
+        else:
+            input(f"\n[Press Enter to run {title} tests...]")
+            # Tests are independent - run them concurrently, print in order
+            batch = await asyncio.gather(*(run_test(query, tool, args) for _, query, tool, args in tests))
+        
+        print("\n" + "-"*60)
+        print(f"CATEGORY {number}: {title}")
+        print("-"*60)
+        
+        for (name, query, tool, args), result in zip(tests, batch):
+            results.append(result)
+            expected = f"{tool}({args})" if tool else "Should ask for clarification (no tool)"
+            print_result(name, query, result, expected)
     
-    for name, query, tool, args in tests:
-        result = run_test(query, tool, args)
-        results.append(result)
-        print_result(name, query, result, "Should ask for clarification (no tool)")
+    # Always live (the Batch API gives no ordering); reported, but not part of the pass rate
+    if not batch_mode:
+        input(f"\n[Press Enter to run {CACHE_CHECK_TITLE} tests...]")
+    cache_result = await run_cache_check()
     
-    # -------------------------------------------------------------------------
-    # TEST CATEGORY 3: Edge Cases
-    # -------------------------------------------------------------------------
-    input("\n[Press Enter to run Edge Case tests...]")
     print("\n" + "-"*60)
-    print("CATEGORY 3: Edge Cases")
+    print(f"CATEGORY {len(TEST_CATEGORIES) + 1}: {CACHE_CHECK_TITLE}")
     print("-"*60)
-    
-    tests = [
-        ("Terse query", "blue widget stock?", 
-         "check_inventory", {"product_id": "blue-widget"}),
-        ("Natural phrasing", "Do you have red gadgets available?", 
-         "check_inventory", {"product_id": "red-gadget"}),
-    ]
-    
-    for name, query, tool, args in tests:
-        result = run_test(query, tool, args)
-        results.append(result)
-        print_result(name, query, result, f"{tool}({args})")
+    print_result("Repeated prefix", CACHE_CHECK_QUERIES[-1], cache_result, "Follow-up call served from prompt cache (cached_tokens > 0)")
     
     # SUMMARY
     print("\n" + "="*60)
@@ -214,11 +255,25 @@ def main():
     print(f"  Failed: {total - passed}")
     print(f"  Pass Rate: {(passed/total)*100:.0f}%")
     
+    prompt_tokens = sum(r["prompt_tokens"] for r in results)
+    cached_tokens = sum(r["cached_tokens"] for r in results)
+    print(f"  Prompt Cache Hits: {cached_tokens}/{prompt_tokens} tokens ({cached_tokens/prompt_tokens*100:.0f}%)")
+    # Best-effort server behaviour - a miss only fails the run when explicitly required
+    require_cache = "--require-prompt-cache" in sys.argv
+    gating = "required by --require-prompt-cache" if require_cache else "not counted in pass rate"
+    print(f"  Prompt Cache Check: {'HIT' if cache_result['passed'] else 'MISS'} ({gating})")
+    
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    if lookups:
+        print(f"  Local Cache Hits: {cache_stats['hits']}/{lookups} ({cache_stats['hits']/lookups*100:.0f}%)")
+    
     print("\n" + "="*60)
+    return passed == total and (cache_result["passed"] or not require_cache)
 
 
 if __name__ == "__main__":
-    main()
+    # Non-zero exit status on any failure so CI can gate on the run
+    sys.exit(0 if asyncio.run(main()) else 1)
 
 
 # == == == == == == == == == == == == == == == == == == == == == == == == == == == == == ==
@@ -237,60 +292,82 @@ if __name__ == "__main__":
 # CATEGORY 1: Tool Selection
 # ------------------------------------------------------------
 
-#  Inventory check: PASS
-#    Query: "Is the blue widget in stock?"
+#   Inventory check: PASS
+#     Query: "Is the blue widget in stock?"
 #     Expected: check_inventory({'product_id': 'blue-widget'})
 #     Actual: check_inventory({'product_id': 'blue-widget'})
+#     [cache] 0/281 prompt tokens cached
 
 #   Order tracking: PASS
-#    Query: "Where is my order ORD-12345?"
+#     Query: "Where is my order ORD-12345?"
 #     Expected: get_order_status({'order_id': 'ORD-12345'})
 #     Actual: get_order_status({'order_id': 'ORD-12345'})
+#     [cache] 0/283 prompt tokens cached
 
 #   Refund request: PASS
-#    Query: "I want to refund ORD-67890, it was damaged"
+#     Query: "I want to refund ORD-67890, it was damaged"
 #     Expected: process_refund({'order_id': 'ORD-67890'})
 #     Actual: process_refund({'order_id': 'ORD-67890', 'reason': 'Damaged item'})
+#     [cache] 0/287 prompt tokens cached
 
-# [Press Enter to run Missing Information tests...]
+# [Press Enter to run Missing Information Handling tests...]
 
 # ------------------------------------------------------------
 # CATEGORY 2: Missing Information Handling
 # ------------------------------------------------------------
 
-#  No order ID: PASS
-#    Query: "I want to return my order"
-#     Expected: Should ask for clarification(no tool)
-#     Actual: [No tool] I can help with that. Please provide your order ID(format l...
+#   No order ID: PASS
+#     Query: "I want to return my order"
+#     Expected: Should ask for clarification (no tool)
+#     Actual: [No tool] I can help with that. Please provide your order ID (format l...
+#     [cache] 0/282 prompt tokens cached
 
-#                                                                          No product: PASS
-#                                                                          Query: "Check if it's in stock"
-#                                                                          Expected: Should ask for clarification(no tool)
-#         Actual: [No tool] Which product would you like me to check? Please give either...
+#   No product: PASS
+#     Query: "Check if it's in stock"
+#     Expected: Should ask for clarification (no tool)
+#     Actual: [No tool] Which product would you like me to check? Please give either...
+#     [cache] 0/281 prompt tokens cached
 
-#         [Press Enter to run Edge Case tests...]
+# [Press Enter to run Edge Cases tests...]
 
-#         - -----------------------------------------------------------
-#         CATEGORY 3: Edge Cases
-#         - -----------------------------------------------------------
+# ------------------------------------------------------------
+# CATEGORY 3: Edge Cases
+# ------------------------------------------------------------
 
-#         Terse query: PASS
-#         Query: "blue widget stock?"
-#         Expected: check_inventory({'product_id': 'blue-widget'})
-#         Actual: check_inventory({'product_id': 'blue-widget'})
+#   Terse query: PASS
+#     Query: "blue widget stock?"
+#     Expected: check_inventory({'product_id': 'blue-widget'})
+#     Actual: check_inventory({'product_id': 'blue-widget'})
+#     [cache] 0/280 prompt tokens cached
 
-#         Natural phrasing: FAIL
-#         Query: "Do you have red gadgets available?"
-#         Expected: check_inventory({'product_id': 'red-gadget'})
-#         Actual: [No tool] I can check that — could you tell me which product you mean?...
+#   Natural phrasing: FAIL
+#     Query: "Do you have red gadgets available?"
+#     Expected: check_inventory({'product_id': 'red-gadget'})
+#     Actual: [No tool] I can check that — could you tell me which product you mean?...
+#     [cache] 0/284 prompt tokens cached
 
-# == == ========================================================
-#         TEST SUMMARY
-# == == ========================================================
+# [Press Enter to run Prompt-Cache Efficiency tests...]
 
-#         Total: 7
-#         Passed: 6
-#         Failed: 1
-#         Pass Rate: 86 %
+# ------------------------------------------------------------
+# CATEGORY 4: Prompt-Cache Efficiency
+# ------------------------------------------------------------
 
-# == ==========================================================
\ No newline at end of file
+#   Repeated prefix: PASS
+#     Query: "pong"
+#     Expected: Follow-up call served from prompt cache (cached_tokens > 0)
+#     Actual: [No tool] Pong! How can I help you with Globomantics today?...
+#     [cache] 1664/1756 prompt tokens cached
+
+# ============================================================
+# TEST SUMMARY
+# ============================================================
+
+#   Total: 7
+#   Passed: 6
+#   Failed: 1
+#   Pass Rate: 86%
+#   Prompt Cache Hits: 0/1978 tokens (0%)
+#   Prompt Cache Check: HIT (not counted in pass rate)
+#   Local Cache Hits: 0/7 (0%)
+
+# ============================================================
@@ -0,0 +1,69 @@
+"""
+Module 2: Shared Tool Schemas
+=============================
+Single definition of the Globomantics support tools used by the Module 2
+demos. Sharing one copy keeps the schemas byte-identical across demos,
+which keeps OpenAI's prompt-prefix cache hitting.
+"""
+
+GET_ORDER_STATUS_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_order_status",
+        "description": "Retrieve order status. Use when customer asks about order delivery or tracking.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string", "description": "Order identifier (ORD-XXXXX)"}
+            },
+            "required": ["order_id"]
+        }
+    }
+}
+
+CHECK_INVENTORY_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "check_inventory",
+        "description": "Check if a product is in stock. Use for availability questions.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "product_id": {"type": "string", "description": "Product ID (lowercase-hyphen format)"}
+            },
+            "required": ["product_id"]
+        }
+    }
+}
+
+PROCESS_REFUND_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "process_refund",
+        "description": "Process a refund. Use when customer explicitly requests return or refund.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "order_id": {"type": "string", "description": "Order identifier"},
+                "reason": {"type": "string", "description": "Reason for refund"}
+            },
+            "required": ["order_id", "reason"]
+        }
+    }
+}
+
+TOOLS = [GET_ORDER_STATUS_TOOL, CHECK_INVENTORY_TOOL, PROCESS_REFUND_TOOL]
+
+# Static prefix (tools + system prompt) must stay byte-identical across calls
+# so OpenAI's automatic prompt caching can reuse it - keep dynamic content last
+SYSTEM_PROMPT = """You are a customer support agent for Globomantics.
+
+Tools:
+- get_order_status: Check order status (requires order_id)
+- check_inventory: Check product availability (requires product_id)
+- process_refund: Process refund (requires order_id and reason)
+
+Rules:
+1. If order_id is not provided, ASK for it - never guess
+2. Convert product names to IDs: "Blue Widget" -> "blue-widget"
+"""
@@ -0,0 +1,49 @@
+"""
+Module 2: Stress Tests as a pytest Suite
+========================================
+Runs the 03_stress_testing.py cases (ALL_TESTS) as parametrized pytest tests,
+so CI gets per-case results and JUnit XML, and pytest-xdist can spread the
+cases across worker processes (each with its own pooled client).
+
+These tests call the live OpenAI API, so they are opt-in:
+
+    pip install -r requirements-dev.txt
+    LIVE_API_TESTS=1 pytest m2-reliable-agents -n auto --junitxml=stress-report.xml
+"""
+
+import os
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+# The demo script's name starts with a digit, so load it by path
+_spec = importlib.util.spec_from_file_location(
+    "stress_testing", Path(__file__).resolve().parent / "03_stress_testing.py"
+)
+stress = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(stress)
+
+pytestmark = pytest.mark.skipif(
+    os.getenv("LIVE_API_TESTS") != "1",
+    reason="calls the live OpenAI API - set LIVE_API_TESTS=1 to run"
+)
+
+
+@pytest.fixture(scope="module")
+def loop():
+    """One event loop per worker - the shared async client stays bound to it"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.mark.parametrize(
+    "name,query,tool,args",
+    stress.ALL_TESTS,
+    ids=[name for name, _, _, _ in stress.ALL_TESTS]
+)
+def test_agent(loop, name, query, tool, args):
+    result = loop.run_until_complete(stress.run_test(query, tool, args))
+    assert result["passed"], f"{name} failed: {result}"